@@ -3,6 +3,8 @@ from __future__ import annotations
 import os
 import re
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
 from posixpath import normpath
 from typing import Callable, Generator
 from wsgiref.headers import Headers
@@ -16,6 +18,15 @@ from .string_utils import (
     ensure_leading_trailing_slash,
 )
 
+# Map each status to its full status line e.g. 200 => "200 OK", so these
+# don't need formatting on every request
+STATUS_LINES = {status: f"{status} {status.phrase}" for status in HTTPStatus}
+
+# Servers which support sendfile() ignore this, but for those that read the
+# file in Python larger blocks mean fewer iterations and system calls than
+# FileWrapper's default of 8KB
+BLOCK_SIZE = 64 * 1024
+
 
 class WhiteNoise:
 
@@ -48,9 +59,19 @@ class WhiteNoise:
     ):
         self.autorefresh = autorefresh
         self.max_age = max_age
+        # There are only two possible Cache-Control values so build them once
+        self.immutable_cache_control = f"max-age={self.FOREVER}, public, immutable"
+        if max_age is not None:
+            self.cache_control: str | None = f"max-age={max_age}, public"
+        else:
+            self.cache_control = None
         self.allow_all_origins = allow_all_origins
         self.charset = charset
         self.add_headers_function = add_headers_function
+        # Headers which are identical for every file, so only need building once
+        self.common_headers: list[tuple[str, str]] = []
+        if allow_all_origins:
+            self.common_headers.append(("Access-Control-Allow-Origin", "*"))
         if index_file is True:
             self.index_file = "index.html"
         else:
@@ -64,18 +85,23 @@ class WhiteNoise:
                 self.immutable_file_test = immutable_file_test
 
         self.media_types = MediaTypes(extra_types=mimetypes)
+        # Maps media types to full Content-Type header values. Static files
+        # only use a handful of distinct types so these are built just once
+        self.content_types: dict[str, str] = {}
         self.application = application
         self.files = {}
         self.directories = []
+        # Decide how to look up files once here, rather than checking
+        # `autorefresh` on every request
+        self.lookup_file: Callable[[str], Redirect | StaticFile | None] = (
+            self.find_file if autorefresh else self.files.get
+        )
         if root is not None:
             self.add_files(root, prefix)
 
     def __call__(self, environ, start_response):
         path = decode_path_info(environ.get("PATH_INFO", ""))
-        if self.autorefresh:
-            static_file = self.find_file(path)
-        else:
-            static_file = self.files.get(path)
+        static_file = self.lookup_file(path)
         if static_file is None:
             return self.application(environ, start_response)
         else:
@@ -84,11 +110,12 @@ class WhiteNoise:
     @staticmethod
     def serve(static_file, environ, start_response):
         response = static_file.get_response(environ["REQUEST_METHOD"], environ)
-        status_line = f"{response.status} {response.status.phrase}"
-        start_response(status_line, list(response.headers))
+        # PEP 3333 requires an actual list of headers, so we still need to copy
+        # the shared list here
+        start_response(STATUS_LINES[response.status], list(response.headers))
         if response.file is not None:
             file_wrapper = environ.get("wsgi.file_wrapper", FileWrapper)
-            return file_wrapper(response.file)
+            return file_wrapper(response.file, BLOCK_SIZE)
         else:
             return []
 
@@ -152,7 +179,9 @@ class WhiteNoise:
         for root, prefix in self.directories:
             if url.startswith(prefix):
                 path = os.path.join(root, url[len(prefix) :])
-                if os.path.commonprefix((root, path)) == root:
+                # Guard against paths escaping the root (`root` always ends
+                # with a separator so a simple prefix check is sufficient)
+                if path.startswith(root):
                     yield path
 
     def find_file_at_path(self, path: str, url: str) -> Redirect | StaticFile:
@@ -211,38 +240,50 @@ class WhiteNoise:
         url: str,
         stat_cache: dict[str, os.stat_result] | None = None,
     ) -> StaticFile:
-        # Optimization: bail early if file does not exist
-        if stat_cache is None and not os.path.exists(path):
-            raise MissingFileError(path)
-        headers = Headers([])
+        encodings = {"gzip": path + ".gz", "br": path + ".br"}
+        if stat_cache is None:
+            # Stat the file and its possible alternatives once each here so
+            # that StaticFile doesn't need to stat them again
+            stat_cache = {}
+            for file_path in (path, *encodings.values()):
+                try:
+                    stat_cache[file_path] = os.stat(file_path)
+                except (OSError, ValueError):
+                    # Optimization: bail early if file does not exist
+                    if file_path == path:
+                        raise MissingFileError(path)
+        headers = Headers(list(self.common_headers))
         self.add_mime_headers(headers, path, url)
         self.add_cache_headers(headers, path, url)
-        if self.allow_all_origins:
-            headers["Access-Control-Allow-Origin"] = "*"
         if self.add_headers_function is not None:
             self.add_headers_function(headers, path, url)
         return StaticFile(
             path,
             headers.items(),
             stat_cache=stat_cache,
-            encodings={"gzip": path + ".gz", "br": path + ".br"},
+            encodings=encodings,
         )
 
     def add_mime_headers(self, headers: Headers, path: str, url: str) -> None:
         media_type = self.media_types.get_type(path)
+        try:
+            content_type = self.content_types[media_type]
+        except KeyError:
+            content_type = self.get_content_type(media_type)
+            self.content_types[media_type] = content_type
+        headers.add_header("Content-Type", content_type)
+
+    def get_content_type(self, media_type: str) -> str:
         if media_type.startswith("text/"):
-            params = {"charset": str(self.charset)}
+            return f'{media_type}; charset="{self.charset}"'
         else:
-            params = {}
-        headers.add_header("Content-Type", str(media_type), **params)
+            return media_type
 
     def add_cache_headers(self, headers: Headers, path: str, url: str) -> None:
         if self.immutable_file_test(path, url):
-            headers["Cache-Control"] = "max-age={}, public, immutable".format(
-                self.FOREVER
-            )
-        elif self.max_age is not None:
-            headers["Cache-Control"] = f"max-age={self.max_age}, public"
+            headers["Cache-Control"] = self.immutable_cache_control
+        elif self.cache_control is not None:
+            headers["Cache-Control"] = self.cache_control
 
     def immutable_file_test(self, path: str, url: str) -> bool:
         """
@@ -264,8 +305,8 @@ class WhiteNoise:
             relative_url = "./"
         else:
             raise ValueError(f"Cannot handle redirect: {from_url} > {to_url}")
-        if self.max_age is not None:
-            headers = {"Cache-Control": f"max-age={self.max_age}, public"}
+        if self.cache_control is not None:
+            headers = {"Cache-Control": self.cache_control}
         else:
             headers = {}
         return Redirect(relative_url, headers=headers)
@@ -274,9 +315,34 @@ class WhiteNoise:
 def scantree(root: str) -> Generator[tuple[str, os.stat_result], None, None]:
     """
     Recurse the given directory yielding (pathname, os.stat(pathname)) pairs
+
+    Each directory is scanned in a worker thread so that, on filesystems
+    where stat calls are slow (e.g. network mounts), directories are scanned
+    concurrently rather than one after another
     """
-    for entry in os.scandir(root):
-        if entry.is_dir():
-            yield from scantree(entry.path)
-        else:
-            yield entry.path, entry.stat()
+    with ThreadPoolExecutor() as executor:
+        pending = [executor.submit(scandir_with_stats, root)]
+        while pending:
+            files, directories = pending.pop().result()
+            pending.extend(
+                executor.submit(scandir_with_stats, path) for path in directories
+            )
+            yield from files
+
+
+def scandir_with_stats(
+    path: str,
+) -> tuple[list[tuple[str, os.stat_result]], list[str]]:
+    """
+    Return a list of (pathname, os.stat(pathname)) pairs for the files in the
+    given directory, and a list of its subdirectories
+    """
+    files = []
+    directories = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                directories.append(entry.path)
+            else:
+                files.append((entry.path, entry.stat()))
+    return files, directories
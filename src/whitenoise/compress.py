@@ -1,11 +1,14 @@
 from __future__ import annotations
 
 import argparse
-import gzip
+import mmap
 import os
-import re
-from io import BytesIO
-from typing import Callable, Generator, Pattern, Sequence
+import stat
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import BinaryIO, Callable, ClassVar, Generator, Sequence
 
 try:
     import brotli
@@ -14,6 +17,20 @@ try:
 except ImportError:  # pragma: no cover
     brotli_installed = False
 
+try:
+    from isal import igzip
+
+    isal_installed = True
+except ImportError:  # pragma: no cover
+    isal_installed = False
+
+try:
+    import zopfli.gzip
+
+    zopfli_installed = True
+except ImportError:  # pragma: no cover
+    zopfli_installed = False
+
 
 def noop_log(message: str) -> None:
     pass
@@ -22,7 +39,7 @@ def noop_log(message: str) -> None:
 class Compressor:
 
     # Extensions that it's not worth trying to compress
-    SKIP_COMPRESS_EXTENSIONS = (
+    SKIP_COMPRESS_EXTENSIONS: ClassVar[tuple[str, ...]] = (
         # Images
         "jpg",
         "jpeg",
@@ -45,6 +62,19 @@ class Compressor:
         "woff2",
     )
 
+    # Extensions for which brotli's UTF-8 text mode gives better compression
+    TEXT_EXTENSIONS: ClassVar[frozenset[str]] = frozenset(
+        ("css", "js", "mjs", "html", "htm", "svg", "json", "xml", "txt", "map")
+    )
+
+    # Number of bytes from the start of each file used to judge whether it is
+    # worth trying to compress
+    SAMPLE_SIZE: ClassVar[int] = 8 * 1024
+
+    # Compressed output is written to temporary files with this suffix before
+    # being moved into place
+    TEMP_FILE_SUFFIX: ClassVar[str] = ".whitenoise-tmp"
+
     def __init__(
         self,
         extensions: Sequence[str] | None = None,
@@ -52,66 +82,142 @@ class Compressor:
         use_brotli: bool = True,
         log: Callable[[str], None] = print,
         quiet: bool = False,
+        use_zopfli: bool = False,
+        brotli_quality: int = 11,
+        # Files smaller than this are never worth compressing as the gains
+        # are outweighed by the encoding overhead
+        min_size: int = 150,
     ) -> None:
         if extensions is None:
             extensions = self.SKIP_COMPRESS_EXTENSIONS
-        self.extension_re = self.get_extension_re(extensions)
+        self.skip_extensions = frozenset(ext.lower() for ext in extensions)
+        # Multi-part extensions (e.g. "min.js") can't be matched by looking at
+        # the final extension alone so are checked as suffixes instead
+        self.skip_suffixes = tuple(
+            "." + ext for ext in self.skip_extensions if "." in ext
+        )
         self.use_gzip = use_gzip
         self.use_brotli = use_brotli and brotli_installed
+        self.use_zopfli = use_zopfli and zopfli_installed
+        self.brotli_quality = brotli_quality
+        self.min_size = min_size
         if not quiet:
             self.log = log
         else:
             self.log = noop_log
 
-    @staticmethod
-    def get_extension_re(extensions: Sequence[str]) -> Pattern[str]:
-        if not extensions:
-            return re.compile("^$")
-        else:
-            return re.compile(
-                r"\.({})$".format("|".join(map(re.escape, extensions))), re.IGNORECASE
-            )
-
     def should_compress(self, filename: str) -> bool:
-        return not self.extension_re.search(filename)
+        if filename.endswith(self.TEMP_FILE_SUFFIX):
+            # In-progress output from this or an interrupted earlier run
+            return False
+        _, dot, extension = filename.rpartition(".")
+        if not dot:
+            return True
+        if extension.lower() in self.skip_extensions:
+            return False
+        return not (
+            self.skip_suffixes and filename.lower().endswith(self.skip_suffixes)
+        )
 
     def compress(self, path: str) -> Generator[str, None, None]:
         with open(path, "rb") as f:
             stat_result = os.fstat(f.fileno())
-            data = f.read()
-        size = len(data)
+            size = stat_result.st_size
+            # Empty files can't be memory mapped (and aren't worth compressing)
+            if size == 0 or size < self.min_size:
+                self.log(f"Skipping small file {path}")
+                return
+            # Map the file rather than reading it so that large bundles don't
+            # need to be copied into memory before being compressed
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                # Not all filesystems support memory mapping (e.g. some FUSE
+                # and network mounts) so fall back to reading the file
+                yield from self.compress_data(path, f.read(), size, stat_result)
+                return
+            with mapped:
+                yield from self.compress_data(path, mapped, size, stat_result)
+
+    def compress_data(
+        self,
+        path: str,
+        data: bytes | mmap.mmap,
+        size: int,
+        stat_result: os.stat_result,
+    ) -> Generator[str, None, None]:
+        if self.looks_incompressible(data[: self.SAMPLE_SIZE]):
+            self.log(f"Skipping {path} (content looks incompressible)")
+            return
         if self.use_brotli:
-            compressed = self.compress_brotli(data)
-            if self.is_compressed_effectively("Brotli", path, size, compressed):
-                yield self.write_data(path, compressed, ".br", stat_result)
+            is_text = path.rpartition(".")[2].lower() in self.TEXT_EXTENSIONS
+            compress_brotli = partial(self.compress_brotli, data, is_text)
+            if self.write_compressed(
+                "Brotli", path, size, ".br", compress_brotli, stat_result
+            ):
+                yield path + ".br"
             else:
                 # If Brotli compression wasn't effective gzip won't be either
                 return
         if self.use_gzip:
-            compressed = self.compress_gzip(data)
-            if self.is_compressed_effectively("Gzip", path, size, compressed):
-                yield self.write_data(path, compressed, ".gz", stat_result)
+            compress_gzip = partial(self.compress_gzip, data)
+            if self.write_compressed(
+                "Gzip", path, size, ".gz", compress_gzip, stat_result
+            ):
+                yield path + ".gz"
 
     @staticmethod
-    def compress_gzip(data: bytes) -> bytes:
-        output = BytesIO()
-        # Explicitly set mtime to 0 so gzip content is fully determined
-        # by file content (0 = "no timestamp" according to gzip spec)
-        with gzip.GzipFile(
-            filename="", mode="wb", fileobj=output, compresslevel=9, mtime=0
-        ) as gz_file:
-            gz_file.write(data)
-        return output.getvalue()
+    def looks_incompressible(sample: bytes) -> bool:
+        """
+        Cheaply detect content that is already compressed (e.g. minified and
+        gzipped output that has crept into the static files) by seeing whether
+        zlib's fastest level can shrink a sample of it, so we can skip running
+        the (much slower) real compressors over it
+        """
+        size = len(sample)
+        if not size:
+            return False
+        return len(zlib.compress(sample, 1)) > size * 0.95
 
-    @staticmethod
-    def compress_brotli(data: bytes) -> bytes:
-        result: bytes = brotli.compress(data)
-        return result
+    def compress_gzip(self, data: bytes | mmap.mmap, output: BinaryIO) -> None:
+        if self.use_zopfli:
+            # Much slower than zlib but produces smaller output which is still
+            # a standard gzip stream (with mtime set to 0)
+            # zopfli only accepts bytes, not memory maps (the copy is
+            # insignificant next to the cost of compression)
+            output.write(zopfli.gzip.compress(bytes(data), numiterations=15))
+            return
+        if isal_installed:
+            # ISA-L's SIMD accelerated deflate is many times faster than zlib.
+            # Level 3 is its highest compression level.
+            output.write(igzip.compress(data, compresslevel=3, mtime=0))
+            return
+        # Have zlib write the gzip wrapper itself (wbits of 16 + 15) rather
+        # than going through the slower GzipFile. zlib always writes an mtime
+        # of 0 so gzip content is fully determined by file content (0 = "no
+        # timestamp" according to gzip spec)
+        compressor = zlib.compressobj(
+            9, zlib.DEFLATED, 16 + zlib.MAX_WBITS, zlib.DEF_MEM_LEVEL
+        )
+        output.write(compressor.compress(data))
+        output.write(compressor.flush())
+
+    def compress_brotli(
+        self, data: bytes | mmap.mmap, is_text: bool, output: BinaryIO
+    ) -> None:
+        # A 16MB window (the maximum) lets large bundles make use of long
+        # distance references; it makes no difference to smaller files
+        compressor = brotli.Compressor(
+            mode=brotli.MODE_TEXT if is_text else brotli.MODE_GENERIC,
+            quality=self.brotli_quality,
+            lgwin=24,
+        )
+        output.write(compressor.process(data))
+        output.write(compressor.finish())
 
     def is_compressed_effectively(
-        self, encoding_name: str, path: str, orig_size: int, data: bytes
+        self, encoding_name: str, path: str, orig_size: int, compressed_size: int
     ) -> bool:
-        compressed_size = len(data)
         if orig_size == 0:
             is_effective = False
         else:
@@ -127,14 +233,61 @@ class Compressor:
             self.log(f"Skipping {path} ({encoding_name} compression not effective)")
         return is_effective
 
-    def write_data(
-        self, path: str, data: bytes, suffix: str, stat_result: os.stat_result
-    ) -> str:
+    def write_compressed(
+        self,
+        encoding_name: str,
+        path: str,
+        orig_size: int,
+        suffix: str,
+        compress_function: Callable[[BinaryIO], None],
+        stat_result: os.stat_result,
+    ) -> bool:
+        """
+        Stream compressed output straight to a temporary file which is only
+        moved into place if compression turns out to be effective. This means
+        an existing compressed file is never left partially written.
+        """
         filename = path + suffix
-        with open(filename, "wb") as f:
-            f.write(data)
-        os.utime(filename, (stat_result.st_atime, stat_result.st_mtime))
-        return filename
+        # Use a unique name so we never clobber (or get clobbered by) another
+        # file, e.g. one left behind by an interrupted run
+        directory, basename = os.path.split(filename)
+        fd, tmp_filename = tempfile.mkstemp(
+            dir=directory, prefix=f".{basename}.", suffix=self.TEMP_FILE_SUFFIX
+        )
+        with open(fd, "wb") as f:
+            try:
+                compress_function(f)
+            except BaseException:
+                f.close()
+                os.unlink(tmp_filename)
+                raise
+            compressed_size = f.tell()
+        if not self.is_compressed_effectively(
+            encoding_name, path, orig_size, compressed_size
+        ):
+            os.unlink(tmp_filename)
+            return False
+        # Temporary files are created private to the user, whereas compressed
+        # files should be as readable as the originals
+        os.chmod(tmp_filename, stat.S_IMODE(stat_result.st_mode))
+        os.utime(tmp_filename, (stat_result.st_atime, stat_result.st_mtime))
+        os.replace(tmp_filename, filename)
+        return True
+
+
+def compress_path(compressor: Compressor, path: str) -> list[str]:
+    # Module level so it can be pickled and sent to worker processes
+    return list(compressor.compress(path))
+
+
+def positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be a positive integer: {value!r}")
+    return number
 
 
 def main(argv: Sequence[str] | None = None) -> int:
@@ -159,6 +312,26 @@ def main(argv: Sequence[str] | None = None) -> int:
         action="store_false",
         dest="use_brotli",
     )
+    parser.add_argument(
+        "--brotli-quality",
+        type=int,
+        choices=range(12),
+        metavar="QUALITY",
+        default=11,
+        help="Brotli quality level from 0 to 11, lower is faster (default: 11)",
+    )
+    parser.add_argument(
+        "--zopfli",
+        help="Use Zopfli to produce smaller (but much slower to build) '.gz' files",
+        action="store_true",
+        dest="use_zopfli",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=positive_int,
+        help="Number of files to compress in parallel (default: number of CPUs)",
+    )
     parser.add_argument("root", help="Path root from which to search for files")
     default_exclude = ", ".join(Compressor.SKIP_COMPRESS_EXTENSIONS)
     parser.add_argument(
@@ -171,19 +344,34 @@ def main(argv: Sequence[str] | None = None) -> int:
         default=Compressor.SKIP_COMPRESS_EXTENSIONS,
     )
     args = parser.parse_args(argv)
+    if args.use_zopfli and not zopfli_installed:
+        parser.error("--zopfli requires the zopfli package to be installed")
 
     compressor = Compressor(
         extensions=args.extensions,
         use_gzip=args.use_gzip,
         use_brotli=args.use_brotli,
         quiet=args.quiet,
+        use_zopfli=args.use_zopfli,
+        brotli_quality=args.brotli_quality,
+    )
+    paths = (
+        os.path.join(dirpath, filename)
+        for dirpath, _dirs, files in os.walk(args.root)
+        for filename in files
+        if compressor.should_compress(filename)
     )
-    for dirpath, _dirs, files in os.walk(args.root):
-        for filename in files:
-            if compressor.should_compress(filename):
-                path = os.path.join(dirpath, filename)
-                for _compressed in compressor.compress(path):
-                    pass
+    if args.jobs == 1:
+        for path in paths:
+            compress_path(compressor, path)
+    else:
+        # Each file is compressed independently so we can fan the work out
+        # across all available cores
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            for _compressed in executor.map(
+                partial(compress_path, compressor), paths, chunksize=16
+            ):
+                pass
 
     return 0
 
@@ -10,7 +10,7 @@ from django.contrib.staticfiles.storage import staticfiles_storage
 from django.http import FileResponse
 from django.urls import get_script_prefix
 
-from .base import WhiteNoise
+from .base import BLOCK_SIZE, WhiteNoise
 from .string_utils import decode_if_byte_string, ensure_leading_trailing_slash
 
 __all__ = ["WhiteNoiseMiddleware"]
@@ -24,6 +24,10 @@ class WhiteNoiseFileResponse(FileResponse):
     are actively harmful.
     """
 
+    # Files are opened unbuffered so read them in larger blocks than Django's
+    # default of 4KB
+    block_size = BLOCK_SIZE
+
     def set_headers(self, *args, **kwargs):
         pass
 
@@ -32,9 +36,6 @@ class WhiteNoiseMiddleware(WhiteNoise):
     """
     Wrap WhiteNoise to allow it to function as Django middleware, rather
     than WSGI middleware
-
-    This functions as both old- and new-style middleware, so can be included in
-    either MIDDLEWARE or MIDDLEWARE_CLASSES.
     """
 
     def __init__(self, get_response=None, settings=settings):
@@ -118,24 +119,19 @@ class WhiteNoiseMiddleware(WhiteNoise):
             self.add_files_from_finders()
 
     def __call__(self, request):
-        response = self.process_request(request)
-        if response is None:
-            response = self.get_response(request)
-        return response
-
-    def process_request(self, request):
-        if self.autorefresh:
-            static_file = self.find_file(request.path_info)
-        else:
-            static_file = self.files.get(request.path_info)
+        static_file = self.lookup_file(request.path_info)
         if static_file is not None:
             return self.serve(static_file, request)
+        return self.get_response(request)
 
     @staticmethod
     def serve(static_file, request):
         response = static_file.get_response(request.method, request.META)
-        status = int(response.status)
-        http_response = WhiteNoiseFileResponse(response.file or (), status=status)
+        # HTTPStatus members are ints already, and Django calls int() on the
+        # status itself so there's no need to convert it here
+        http_response = WhiteNoiseFileResponse(
+            response.file or (), status=response.status
+        )
         # Remove default content-type
         del http_response["content-type"]
         for key, value in response.headers:
@@ -166,9 +162,7 @@ class WhiteNoiseMiddleware(WhiteNoise):
             path = finders.find(url[len(self.static_prefix) :])
             if path:
                 yield path
-        paths = super().candidate_paths_for_url(url)
-        for path in paths:
-            yield path
+        yield from super().candidate_paths_for_url(url)
 
     def immutable_file_test(self, path, url) -> bool:
         """
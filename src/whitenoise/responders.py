@@ -4,13 +4,36 @@ import errno
 import os
 import re
 import stat
+import sys
+from calendar import timegm
 from email.utils import formatdate, parsedate
+from functools import lru_cache
 from http import HTTPStatus
 from io import BufferedIOBase
 from time import mktime
-from typing import BinaryIO, Callable, Pattern, Sequence
+from typing import Any, BinaryIO, Callable, Generic, Sequence, TypeVar
 from urllib.parse import quote
-from wsgiref.headers import Headers
+
+T = TypeVar("T")
+
+if sys.version_info >= (3, 8):
+    from functools import cached_property
+else:  # pragma: no cover
+
+    class cached_property(Generic[T]):
+        """
+        Minimal version of `functools.cached_property` for Python 3.7
+        """
+
+        def __init__(self, func: Callable[[Any], T]) -> None:
+            self.func = func
+            self.__doc__ = func.__doc__
+
+        def __get__(self, instance: Any, owner: type | None = None) -> Any:
+            if instance is None:
+                return self
+            value = instance.__dict__[self.func.__name__] = self.func(instance)
+            return value
 
 
 class Response:
@@ -30,28 +53,102 @@ NOT_ALLOWED_RESPONSE = Response(
     file=None,
 )
 
+# Not available on Windows
+pread_supported = hasattr(os, "pread")
+
+BYTE_RANGE_RE = re.compile(r"bytes=\s*(\d*)-(\d*)")
+
 # Headers which should be returned with a 304 Not Modified response as
 # specified here: https://tools.ietf.org/html/rfc7232#section-4.1
-NOT_MODIFIED_HEADERS = (
-    "Cache-Control",
-    "Content-Location",
-    "Date",
-    "ETag",
-    "Expires",
-    "Vary",
+# (lowercased for case-insensitive matching)
+NOT_MODIFIED_HEADERS = frozenset(
+    (
+        "cache-control",
+        "content-location",
+        "date",
+        "etag",
+        "expires",
+        "vary",
+    )
 )
 
 
+@lru_cache(maxsize=1024)
+def parse_http_date(value: str) -> int | None:
+    """
+    Parse an HTTP date into an integer timestamp (HTTP dates have one second
+    resolution so nothing is lost), or return None if it's not valid
+
+    Clients send the same If-Modified-Since value for every asset on a page so
+    caching the (surprisingly slow) parse is worthwhile
+    """
+    parsed = parsedate(value)
+    if parsed is None:
+        return None
+    try:
+        return timegm(parsed)
+    except (ValueError, OverflowError):
+        # `parsedate` accepts years which `datetime` can't represent
+        return None
+
+
+@lru_cache(maxsize=4096)
+def cached_formatdate(timestamp: int) -> str:
+    """
+    HTTP dates only have one second resolution so, keyed on whole seconds, the
+    files in a typical deploy (written within a few moments of each other)
+    share just a handful of entries here
+    """
+    return formatdate(timestamp, usegmt=True)
+
+
+@lru_cache(maxsize=4096)
+def get_etag(last_modified: str | None, size: int) -> str | None:
+    """
+    Derive an ETag from a file's Last-Modified header and size
+
+    In autorefresh mode this runs on every request, but for an unchanged file
+    the inputs (and so the result) are always the same, so we cache it
+    """
+    if not last_modified:
+        return None
+    last_modified_ts = parsedate(last_modified)
+    if not last_modified_ts:
+        return None
+    timestamp = int(mktime(last_modified_ts))
+    return f'"{timestamp:x}-{size:x}"'
+
+
+@lru_cache(maxsize=64)
+def parse_accept_encoding(accept_encoding: str) -> frozenset[str]:
+    """
+    Return the set of content-codings listed in an Accept-Encoding header
+
+    Only a handful of distinct header values are seen in practice so the
+    result is cached
+    """
+    return frozenset(
+        token.partition(";")[0].strip().lower() for token in accept_encoding.split(",")
+    )
+
+
 class SlicedFile(BufferedIOBase):
     """
     A file like wrapper to handle seeking to the start byte of a range request
     and to return no further output once the end byte of a range request has
     been reached.
+
+    Where the platform supports it, reads are made with `os.pread` at an
+    explicit offset which saves seeking the underlying file.
     """
 
     def __init__(self, fileobj: BinaryIO, start: int, end: int) -> None:
-        fileobj.seek(start)
+        if pread_supported:
+            self.fd = fileobj.fileno()
+        else:  # pragma: no cover
+            fileobj.seek(start)
         self.fileobj = fileobj
+        self.offset = start
         self.remaining = end - start + 1
 
     def read(self, size: int | None = -1) -> bytes:
@@ -61,7 +158,11 @@ class SlicedFile(BufferedIOBase):
             size = self.remaining
         else:
             size = min(size, self.remaining)
-        data = self.fileobj.read(size)
+        if pread_supported:
+            data = os.pread(self.fd, size, self.offset)
+        else:  # pragma: no cover
+            data = self.fileobj.read(size)
+        self.offset += len(data)
         self.remaining -= len(data)
         return data
 
@@ -77,12 +178,61 @@ class StaticFile:
         encodings: dict[str, str] | None = None,
         stat_cache: dict[str, os.stat_result] | None = None,
     ) -> None:
-        files = self.get_file_stats(path, encodings, stat_cache)
-        parsed_headers = self.get_headers(headers, files)
-        self.last_modified = parsedate(parsed_headers["Last-Modified"])
-        self.etag = parsed_headers["ETag"]
-        self.not_modified_response = self.get_not_modified_response(parsed_headers)
-        self.alternatives = self.get_alternatives(parsed_headers, files)
+        # Only stat the files up front (so that missing files are reported
+        # immediately), everything else is built on first request as most
+        # files in a large static tree are never requested at all
+        self.files = self.get_file_stats(path, encodings, stat_cache)
+        self.headers_list = headers
+
+    @cached_property
+    def base_headers(self) -> list[tuple[str, str]]:
+        return self.get_headers(self.headers_list, self.files)
+
+    @cached_property
+    def parsed_headers(self) -> dict[str, str]:
+        # Keyed by lowercased name so lookups don't need a case-insensitive
+        # scan of the whole header list
+        return {name.lower(): value for name, value in self.base_headers}
+
+    @cached_property
+    def last_modified(self) -> int | None:
+        last_modified = self.parsed_headers.get("last-modified")
+        if last_modified is None:
+            return None
+        return parse_http_date(last_modified)
+
+    @cached_property
+    def etag(self) -> str | None:
+        return self.parsed_headers.get("etag")
+
+    @cached_property
+    def not_modified_response(self) -> Response:
+        return self.get_not_modified_response(self.base_headers)
+
+    @cached_property
+    def alternatives(self) -> list[tuple[str | None, str, list[tuple[str, str]]]]:
+        return self.get_alternatives(self.base_headers, self.files)
+
+    @cached_property
+    def head_responses(self) -> dict[str, Response]:
+        # HEAD responses have no file handle so, outside of Range requests,
+        # they are identical for every request and can be built just once
+        return {
+            path: Response(HTTPStatus.OK, headers, None)
+            for _, path, headers in self.alternatives
+        }
+
+    @cached_property
+    def range_headers(self) -> dict[str, tuple[int, list[tuple[str, str]]]]:
+        # For each alternative, its size and the headers to which the
+        # Content-Range and Content-Length of a partial response are added
+        return {
+            path: (
+                self.files[encoding].size,
+                [item for item in headers if item[0] != "Content-Length"],
+            )
+            for encoding, path, headers in self.alternatives
+        }
 
     def get_response(self, method: str, request_headers: dict[str, str]) -> Response:
         if method not in ("GET", "HEAD"):
@@ -90,14 +240,18 @@ class StaticFile:
         if self.is_not_modified(request_headers):
             return self.not_modified_response
         path, headers = self.get_path_and_headers(request_headers)
+        range_header = request_headers.get("HTTP_RANGE")
         if method != "HEAD":
-            file_handle = open(path, "rb")
+            # Files are always read in large blocks (or passed to sendfile) so
+            # there's nothing to gain from allocating a read buffer per request
+            file_handle = open(path, "rb", buffering=0)
+        elif not range_header:
+            return self.head_responses[path]
         else:
             file_handle = None
-        range_header = request_headers.get("HTTP_RANGE")
         if range_header:
             try:
-                return self.get_range_response(range_header, headers, file_handle)
+                return self.get_range_response(range_header, path, file_handle)
             except ValueError:
                 # If we can't interpret the Range request for any reason then
                 # just ignore it and return the standard response (this
@@ -105,20 +259,17 @@ class StaticFile:
                 pass
         return Response(HTTPStatus.OK, headers, file_handle)
 
-    def get_range_response(self, range_header, base_headers, file_handle) -> Response:
-        headers = []
-        for item in base_headers:
-            if item[0] == "Content-Length":
-                size = int(item[1])
-            else:
-                headers.append(item)
+    def get_range_response(self, range_header, path, file_handle) -> Response:
+        size, base_headers = self.range_headers[path]
         start, end = self.get_byte_range(range_header, size)
-        if start >= end:
+        if start > end:
             return self.get_range_not_satisfiable_response(file_handle, size)
         if file_handle is not None:
             file_handle = SlicedFile(file_handle, start, end)
-        headers.append(("Content-Range", f"bytes {start}-{end}/{size}"))
-        headers.append(("Content-Length", str(end - start + 1)))
+        headers = base_headers + [
+            ("Content-Range", f"bytes {start}-{end}/{size}"),
+            ("Content-Length", str(end - start + 1)),
+        ]
         return Response(HTTPStatus.PARTIAL_CONTENT, headers, file_handle)
 
     def get_byte_range(self, range_header: str, size: int) -> tuple[int, int]:
@@ -133,21 +284,18 @@ class StaticFile:
 
     @staticmethod
     def parse_byte_range(range_header: str) -> tuple[int, int | None]:
-        units, _, range_spec = range_header.strip().partition("=")
-        if units != "bytes":
-            raise ValueError()
-        # Only handle a single range spec. Multiple ranges will trigger a
-        # ValueError below which will result in the Range header being ignored
-        start_str, sep, end_str = range_spec.strip().partition("-")
-        if not sep:
+        # Only handle a single range spec. Multiple ranges (or anything else
+        # unexpected) will fail to match and raise a ValueError which will
+        # result in the Range header being ignored
+        match = BYTE_RANGE_RE.fullmatch(range_header.strip())
+        if match is None:
             raise ValueError()
-        if not start_str:
-            start = -int(end_str)
-            end = None
-        else:
-            start = int(start_str)
-            end = int(end_str) if end_str else None
-        return start, end
+        start_str, end_str = match.groups()
+        if start_str:
+            return int(start_str), int(end_str) if end_str else None
+        if end_str:
+            return -int(end_str), None
+        raise ValueError()
 
     @staticmethod
     def get_range_not_satisfiable_response(file_handle, size: int) -> Response:
@@ -169,6 +317,10 @@ class StaticFile:
         files: dict[str | None, FileEntry] = {None: FileEntry(path, stat_cache)}
         if encodings:
             for encoding, alt_path in encodings.items():
+                # Most files have no compressed alternatives so, where we can,
+                # check the cache directly rather than going via an exception
+                if stat_cache is not None and alt_path not in stat_cache:
+                    continue
                 try:
                     files[encoding] = FileEntry(alt_path, stat_cache)
                 except MissingFileError:
@@ -177,67 +329,73 @@ class StaticFile:
 
     def get_headers(
         self, headers_list: list[tuple[str, str]], files: dict[str | None, FileEntry]
-    ) -> Headers:
-        headers = Headers(headers_list)
+    ) -> list[tuple[str, str]]:
+        headers = list(headers_list)
         main_file = files[None]
         if len(files) > 1:
-            headers["Vary"] = "Accept-Encoding"
-        if "Last-Modified" not in headers:
+            headers = [item for item in headers if item[0].lower() != "vary"]
+            headers.append(("Vary", "Accept-Encoding"))
+        existing = {name.lower(): value for name, value in headers}
+        last_modified = existing.get("last-modified")
+        if last_modified is None:
             mtime = main_file.mtime
             # Not all filesystems report mtimes, and sometimes they report an
             # mtime of 0 which we know is incorrect
             if mtime:
-                headers["Last-Modified"] = formatdate(mtime, usegmt=True)
-        if "ETag" not in headers:
-            last_modified = parsedate(headers["Last-Modified"])
-            if last_modified:
-                timestamp = int(mktime(last_modified))
-                headers["ETag"] = f'"{timestamp:x}-{main_file.size:x}"'
+                last_modified = cached_formatdate(int(mtime))
+                headers.append(("Last-Modified", last_modified))
+        if "etag" not in existing:
+            etag = get_etag(last_modified, main_file.size)
+            if etag is not None:
+                headers.append(("ETag", etag))
         return headers
 
     @staticmethod
-    def get_not_modified_response(headers: Headers) -> Response:
-        not_modified_headers: list[tuple[str, str]] = []
-        for key in NOT_MODIFIED_HEADERS:
-            if key in headers:
-                value = headers[key]
-                assert value is not None
-                not_modified_headers.append((key, value))
+    def get_not_modified_response(headers: list[tuple[str, str]]) -> Response:
+        not_modified_headers = [
+            item for item in headers if item[0].lower() in NOT_MODIFIED_HEADERS
+        ]
         return Response(
             status=HTTPStatus.NOT_MODIFIED, headers=not_modified_headers, file=None
         )
 
     @staticmethod
     def get_alternatives(
-        base_headers: Headers, files: dict[str | None, FileEntry]
-    ) -> list[tuple[Pattern[str], str, list[tuple[str, str]]]]:
+        base_headers: list[tuple[str, str]], files: dict[str | None, FileEntry]
+    ) -> list[tuple[str | None, str, list[tuple[str, str]]]]:
+        # Content-Length is set per alternative below, replacing any existing
+        # value, and compressed alternatives likewise replace Content-Encoding
+        base_headers = [
+            item for item in base_headers if item[0].lower() != "content-length"
+        ]
+        encoded_base_headers = [
+            item for item in base_headers if item[0].lower() != "content-encoding"
+        ]
         # Sort by size so that the smallest compressed alternative matches first
         alternatives = []
         files_by_size = sorted(files.items(), key=lambda i: i[1].size)
         for encoding, file_entry in files_by_size:
-            headers = Headers(base_headers.items())
-            headers["Content-Length"] = str(file_entry.size)
+            content_length = ("Content-Length", str(file_entry.size))
             if encoding:
-                headers["Content-Encoding"] = encoding
-                encoding_re = re.compile(r"\b%s\b" % encoding)
+                headers = encoded_base_headers + [
+                    content_length,
+                    ("Content-Encoding", encoding),
+                ]
             else:
-                encoding_re = re.compile("")
-            alternatives.append((encoding_re, file_entry.path, headers.items()))
+                headers = base_headers + [content_length]
+            alternatives.append((encoding, file_entry.path, headers))
         return alternatives
 
     def is_not_modified(self, request_headers: dict[str, str]) -> bool:
         previous_etag = request_headers.get("HTTP_IF_NONE_MATCH")
         if previous_etag is not None:
             return previous_etag == self.etag
-        if self.last_modified is None:
-            return False
-        try:
-            last_requested = request_headers["HTTP_IF_MODIFIED_SINCE"]
-        except KeyError:
+        last_requested = request_headers.get("HTTP_IF_MODIFIED_SINCE")
+        if last_requested is None or self.last_modified is None:
             return False
-        last_requested_ts = parsedate(last_requested)
+        last_requested_ts = parse_http_date(last_requested)
         if last_requested_ts is not None:
-            return parsedate(last_requested) >= self.last_modified
+            return last_requested_ts >= self.last_modified
         return False
 
     def get_path_and_headers(
@@ -246,9 +404,10 @@ class StaticFile:
         accept_encoding = request_headers.get("HTTP_ACCEPT_ENCODING", "")
         if accept_encoding == "*":
             accept_encoding = ""
+        accepted_encodings = parse_accept_encoding(accept_encoding)
         # These are sorted by size so first match is the best
-        for encoding_re, path, headers in self.alternatives:
-            if encoding_re.search(accept_encoding):
+        for encoding, path, headers in self.alternatives:
+            if encoding is None or encoding in accepted_encodings:
                 return path, headers
 
 
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
 import contextlib
+import errno
 import gzip
+import mmap
 import os
-import re
 import shutil
 import tempfile
+import zlib
 
 import pytest
 
@@ -59,14 +61,162 @@ def test_mtime_is_preserved(files_dir):
     assert os.path.getmtime(path) == os.path.getmtime(gzip_path)
 
 
+@pytest.mark.parametrize("jobs", ["1", "2"])
+def test_compress_with_jobs(tmp_path, jobs):
+    path = tmp_path / COMPRESSABLE_FILE
+    path.write_bytes(TEST_FILES[COMPRESSABLE_FILE])
+    compress_main([str(tmp_path), "--quiet", "--jobs", jobs])
+    with contextlib.closing(gzip.open(str(path) + ".gz", "rb")) as f:
+        contents = f.read()
+    assert TEST_FILES[COMPRESSABLE_FILE] == contents
+
+
+@pytest.mark.parametrize("jobs", ["0", "-1", "many"])
+def test_invalid_jobs(tmp_path, capsys, jobs):
+    with pytest.raises(SystemExit):
+        compress_main([str(tmp_path), "--jobs", jobs])
+    assert "must be a positive integer" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("quality", ["-3", "12", "best"])
+def test_invalid_brotli_quality(tmp_path, capsys, quality):
+    with pytest.raises(SystemExit):
+        compress_main([str(tmp_path), "--brotli-quality", quality])
+    assert "argument --brotli-quality: invalid" in capsys.readouterr().err
+
+
+def test_brotli_quality(tmp_path):
+    brotli = pytest.importorskip("brotli")
+    path = tmp_path / COMPRESSABLE_FILE
+    path.write_bytes(TEST_FILES[COMPRESSABLE_FILE])
+    compressor = Compressor(use_gzip=False, quiet=True, brotli_quality=5)
+    assert [str(path) + ".br"] == list(compressor.compress(str(path)))
+    with open(str(path) + ".br", "rb") as f:
+        assert TEST_FILES[COMPRESSABLE_FILE] == brotli.decompress(f.read())
+
+
+def test_isal_gzip(tmp_path):
+    pytest.importorskip("isal")
+    path = tmp_path / COMPRESSABLE_FILE
+    path.write_bytes(TEST_FILES[COMPRESSABLE_FILE])
+    compressor = Compressor(use_brotli=False, quiet=True)
+    assert [str(path) + ".gz"] == list(compressor.compress(str(path)))
+    with open(str(path) + ".gz", "rb") as f:
+        compressed = f.read()
+    assert gzip.decompress(compressed) == TEST_FILES[COMPRESSABLE_FILE]
+    # A zero mtime keeps output fully determined by the file content
+    assert compressed[4:8] == b"\x00\x00\x00\x00"
+
+
+def test_zopfli_gzip(tmp_path):
+    pytest.importorskip("zopfli")
+    path = tmp_path / COMPRESSABLE_FILE
+    path.write_bytes(TEST_FILES[COMPRESSABLE_FILE])
+    compressor = Compressor(use_brotli=False, quiet=True, use_zopfli=True)
+    assert [str(path) + ".gz"] == list(compressor.compress(str(path)))
+    with open(str(path) + ".gz", "rb") as f:
+        assert gzip.decompress(f.read()) == TEST_FILES[COMPRESSABLE_FILE]
+
+
+def test_zopfli_option_requires_package(tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr("whitenoise.compress.zopfli_installed", False)
+    with pytest.raises(SystemExit):
+        compress_main([str(tmp_path), "--zopfli"])
+    assert "--zopfli requires the zopfli package" in capsys.readouterr().err
+
+
+def test_compresses_without_mmap_support(tmp_path, monkeypatch):
+    def unsupported(*args, **kwargs):
+        raise OSError(errno.ENODEV, "No such device")
+
+    monkeypatch.setattr(mmap, "mmap", unsupported)
+    path = tmp_path / COMPRESSABLE_FILE
+    path.write_bytes(TEST_FILES[COMPRESSABLE_FILE])
+    compressor = Compressor(use_brotli=False, quiet=True)
+    assert [str(path) + ".gz"] == list(compressor.compress(str(path)))
+    with open(str(path) + ".gz", "rb") as f:
+        assert gzip.decompress(f.read()) == TEST_FILES[COMPRESSABLE_FILE]
+
+
+def test_skips_small_files(tmp_path):
+    path = tmp_path / COMPRESSABLE_FILE
+    path.write_bytes(TEST_FILES[COMPRESSABLE_FILE])
+    compressor = Compressor(quiet=True, min_size=1001)
+    assert [] == list(compressor.compress(str(path)))
+    assert not os.path.exists(str(path) + ".gz")
+
+
+def test_ineffective_compression_leaves_no_files(tmp_path):
+    path = tmp_path / COMPRESSABLE_FILE
+    path.write_bytes(TEST_FILES[COMPRESSABLE_FILE])
+    compressor = Compressor(quiet=True)
+    assert not compressor.write_compressed(
+        "Test", str(path), 1000, ".gz", lambda f: f.write(b"x" * 1000), os.stat(path)
+    )
+    assert os.listdir(tmp_path) == [COMPRESSABLE_FILE]
+
+
+def test_ignores_leftover_temporary_files(tmp_path):
+    path = tmp_path / COMPRESSABLE_FILE
+    path.write_bytes(TEST_FILES[COMPRESSABLE_FILE])
+    leftover = tmp_path / f".{COMPRESSABLE_FILE}.gz.abc{Compressor.TEMP_FILE_SUFFIX}"
+    leftover.write_bytes(TEST_FILES[COMPRESSABLE_FILE])
+    compress_main([str(tmp_path), "--quiet", "--jobs", "1"])
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        [leftover.name, COMPRESSABLE_FILE, COMPRESSABLE_FILE + ".gz"]
+        + ([COMPRESSABLE_FILE + ".br"] if Compressor(quiet=True).use_brotli else [])
+    )
+    assert leftover.read_bytes() == TEST_FILES[COMPRESSABLE_FILE]
+
+
+def test_compressed_files_have_original_permissions(tmp_path):
+    path = tmp_path / COMPRESSABLE_FILE
+    path.write_bytes(TEST_FILES[COMPRESSABLE_FILE])
+    path.chmod(0o644)
+    list(Compressor(quiet=True).compress(str(path)))
+    assert os.stat(str(path) + ".gz").st_mode & 0o777 == 0o644
+
+
+def test_looks_incompressible():
+    assert Compressor.looks_incompressible(os.urandom(Compressor.SAMPLE_SIZE))
+    assert not Compressor.looks_incompressible(TEST_FILES[COMPRESSABLE_FILE])
+    assert not Compressor.looks_incompressible(b"")
+
+
+def test_incompressible_check_only_probes_a_sample(tmp_path, monkeypatch):
+    path = tmp_path / COMPRESSABLE_FILE
+    path.write_bytes(b"body { color: red; }\n" * 4096)
+    probed = []
+    original_compress = zlib.compress
+
+    def compress(data, *args):
+        probed.append(len(data))
+        return original_compress(data, *args)
+
+    monkeypatch.setattr(zlib, "compress", compress)
+    compressor = Compressor(use_brotli=False, quiet=True)
+    assert [str(path) + ".gz"] == list(compressor.compress(str(path)))
+    assert probed == [Compressor.SAMPLE_SIZE]
+
+
 def test_with_custom_extensions():
     compressor = Compressor(extensions=["jpg"], quiet=True)
-    assert compressor.extension_re == re.compile(r"\.(jpg)$", re.IGNORECASE)
+    assert compressor.skip_extensions == frozenset(["jpg"])
+    assert not compressor.should_compress("image.JPG")
+    assert compressor.should_compress("image.png")
+    assert compressor.should_compress("jpg")
+
+
+def test_with_multi_part_extensions():
+    compressor = Compressor(extensions=["min.js"], quiet=True)
+    assert not compressor.should_compress("app.MIN.js")
+    assert compressor.should_compress("app.js")
+    assert compressor.should_compress("admin.js")
 
 
 def test_with_falsey_extensions():
-    compressor = Compressor(quiet=True)
-    assert compressor.get_extension_re("") == re.compile("^$")
+    compressor = Compressor(extensions=(), quiet=True)
+    assert compressor.should_compress("image.jpg")
 
 
 def test_custom_log():
@@ -85,6 +235,4 @@ def test_compress():
 
 def test_compressed_effectively_no_orig_size():
     compressor = Compressor(quiet=True)
-    assert not compressor.is_compressed_effectively(
-        "test_encoding", "test_path", 0, "test_data"
-    )
+    assert not compressor.is_compressed_effectively("test_encoding", "test_path", 0, 9)
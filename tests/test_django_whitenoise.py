@@ -10,6 +10,7 @@ from django.conf import settings
 from django.contrib.staticfiles import finders, storage
 from django.core.management import call_command
 from django.core.wsgi import get_wsgi_application
+from django.test import RequestFactory
 from django.test.utils import override_settings
 from django.utils.functional import empty
 
@@ -206,3 +207,14 @@ def test_relative_static_url(server, static_files, _collect_static):
         url = storage.staticfiles_storage.url(static_files.js_path)
         response = server.get(url)
         assert response.content == static_files.js_content
+
+
+def test_full_response_streams_underlying_file(static_files, _collect_static):
+    # Django hands `file_to_stream` to the server's `wsgi.file_wrapper`, which
+    # can only use sendfile() if it is given the real file object
+    middleware = WhiteNoiseMiddleware(get_response=lambda request: None)
+    request = RequestFactory().get(middleware.static_prefix + static_files.js_path)
+    response = middleware(request)
+    with closing(response):
+        assert response.file_to_stream.fileno() >= 0
+        assert int(response["Content-Length"]) == len(static_files.js_content)
@@ -15,7 +15,7 @@ from wsgiref.simple_server import demo_app
 import pytest
 
 from whitenoise import WhiteNoise
-from whitenoise.responders import StaticFile
+from whitenoise.responders import StaticFile, parse_accept_encoding, parse_http_date
 
 from .utils import AppServer, Files
 
@@ -151,6 +151,16 @@ def test_etag_matches(server, files):
     assert response.status_code == 304
 
 
+def test_not_modified_response_headers(server, files):
+    response = server.get(files.js_url)
+    etag = response.headers["ETag"]
+    response = server.get(files.js_url, headers={"If-None-Match": etag})
+    assert response.headers["ETag"] == etag
+    assert "Cache-Control" in response.headers
+    assert "Last-Modified" not in response.headers
+    assert "Content-Type" not in response.headers
+
+
 def test_etag_doesnt_match(server, files):
     etag = '"594bd1d1-36"'
     response = server.get(files.js_url, headers={"If-None-Match": etag})
@@ -258,6 +268,18 @@ def test_request_initial_bytes(server, files):
     assert response.content == files.js_content[0:14]
 
 
+def test_request_single_byte(server, files):
+    response = server.get(files.js_url, headers={"Range": "bytes=0-0"})
+    assert response.status_code == 206
+    assert response.content == files.js_content[0:1]
+
+
+def test_malformed_range_ignored(server, files):
+    response = server.get(files.js_url, headers={"Range": "bytes=0-1_0"})
+    assert response.status_code == 200
+    assert response.content == files.js_content
+
+
 def test_request_trailing_bytes(server, files):
     response = server.get(files.js_url, headers={"Range": "bytes=-3"})
     assert response.content == files.js_content[-3:]
@@ -376,3 +398,49 @@ def test_chunked_file_size_matches_range_with_range_header():
     while response.file.read(1):
         file_size += 1
     assert file_size == 14
+
+
+def test_parse_accept_encoding():
+    assert parse_accept_encoding("gzip, deflate, BR;q=0.9") == {"gzip", "deflate", "br"}
+    assert "br" not in parse_accept_encoding("x-brotli")
+
+
+def test_parse_http_date():
+    assert parse_http_date("Thu, 01 Jan 1970 00:01:00 GMT") == 60
+    assert parse_http_date("Fri, 16 Jul 2021 09:09:1626426577S GMT") is None
+    assert parse_http_date("Thu, 01 Jan 99999 00:00:00 GMT") is None
+
+
+def test_content_type_built_once_per_media_type(files):
+    application = WhiteNoise(demo_app, root=files.directory, charset="latin-1")
+    assert application.content_types["text/css"] == 'text/css; charset="latin-1"'
+    assert application.get_content_type("image/png") == "image/png"
+
+
+def test_static_file_headers_built_on_first_request():
+    responder = StaticFile(__file__, [])
+    assert "alternatives" not in vars(responder)
+    response = responder.get_response("HEAD", {})
+    assert "alternatives" in vars(responder)
+    assert Headers(response.headers)["ETag"] == responder.etag
+
+
+def test_static_file_header_names_are_case_insensitive():
+    responder = StaticFile(__file__, [("etag", '"custom"'), ("content-length", "1")])
+    response = responder.get_response("HEAD", {})
+    headers = Headers(response.headers)
+    assert headers.get_all("ETag") == ['"custom"']
+    assert headers.get_all("Content-Length") == [str(os.path.getsize(__file__))]
+
+
+def test_head_response_reused_across_requests():
+    responder = StaticFile(__file__, [])
+    response = responder.get_response("HEAD", {})
+    assert response.file is None
+    assert responder.get_response("HEAD", {}) is response
+
+
+def test_custom_content_encoding_kept_for_uncompressed_file():
+    responder = StaticFile(__file__, [("Content-Encoding", "gzip")])
+    response = responder.get_response("HEAD", {})
+    assert Headers(response.headers).get_all("Content-Encoding") == ["gzip"]